@@ -1,8 +1,15 @@
 """Base directory and .env loading. Works when run as script or as PyInstaller binary."""
 import os
+import re
 import sys
 from pathlib import Path
 
+# KEY = value, value optionally "quoted"/'quoted', comment lines never match.
+# One match per line replaces the strip/startswith/partition/strip-quotes chain.
+# Unquoted values may contain spaces (e.g. a Gmail App Password pasted with
+# its four groups) and run to an inline # or end of line.
+_ENV_RE = re.compile(r'^\s*([A-Za-z_][A-Za-z0-9_]*)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^#\r\n]*))')
+
 
 def get_base_dir() -> Path:
     """Directory for .env, token.json, state.json, credentials.json (next to exe when frozen)."""
@@ -13,15 +20,17 @@ def get_base_dir() -> Path:
 
 def load_dotenv() -> None:
     """Load .env from get_base_dir() into os.environ (only set if not already set)."""
-    base = get_base_dir()
-    env_file = base / ".env"
+    env_file = get_base_dir() / ".env"
     if not env_file.exists():
         return
-    with open(env_file) as f:
-        for line in f:
-            line = line.strip()
-            if line and not line.startswith("#") and "=" in line:
-                k, _, v = line.partition("=")
-                k, v = k.strip(), v.strip().strip('"').strip("'")
-                if k and v:
-                    os.environ.setdefault(k, v)
+    for line in env_file.read_text().splitlines():
+        m = _ENV_RE.match(line)
+        if not m:
+            continue
+        v = m.group(2)
+        if v is None:
+            v = m.group(3)
+        if v is None:
+            v = m.group(4).strip()  # quoted values keep their spacing as-is
+        if v:
+            os.environ.setdefault(m.group(1), v)
@@ -9,19 +9,41 @@ from env_loader import get_base_dir, load_dotenv
 
 load_dotenv()
 
-import base64
 import email
 import json
+import logging
 import os
+import random
 import re
 import sys
+import threading
+import time
+from collections import defaultdict
 from datetime import date
-from email.header import decode_header
+from email import policy
 from pathlib import Path
 
-import imapclient
+# imapclient is imported lazily inside the functions that talk IMAP: the bot
+# pays that import only on the first /link, not at startup.
 import requests
 
+# Optional: Rust JSON codec — faster (de)serialization for state.json and
+# Telegram payloads, working on bytes straight off the socket.
+try:
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
+
+
+def _json_loads(data):
+    return _orjson.loads(data) if _orjson is not None else json.loads(data)
+
+
+# Buffered logging instead of print(..., flush=True): one write per record,
+# no forced flush syscall per status line.
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s", stream=sys.stderr)
+log = logging.getLogger("e2t")
+
 # --- Config from environment ---
 IMAP_HOST = os.environ.get("IMAP_HOST", "imap.gmail.com")
 IMAP_PORT = int(os.environ.get("IMAP_PORT", "993"))
@@ -38,32 +60,95 @@ SUBJECT_FILTER = os.environ.get("SUBJECT_FILTER", "Claude").strip()
 # Max length per Telegram message (leave a bit of margin)
 TELEGRAM_MAX_LENGTH = 4050
 
+# One keep-alive session for all Telegram API calls (here and in the bot):
+# the TLS handshake to api.telegram.org is paid once, then every
+# sendMessage/getUpdates reuses the pooled connection.
+_SESSION = requests.Session()
+_SESSION.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+
+class _Bucket:
+    """Token bucket; acquire() blocks until a token is available. Thread-safe:
+    the bot dispatches sends from several executor threads at once."""
+
+    def __init__(self, capacity, refill_per_sec):
+        self.capacity = float(capacity)
+        self.refill = float(refill_per_sec)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.refill
+            time.sleep(wait)
+
+
+# Telegram allows ~1 msg/sec per chat and ~30/sec overall; pace our sends so
+# bursts (chunked bodies, catch-up) don't trigger a 429 back-off.
+_GLOBAL_BUCKET = _Bucket(30, 30)
+_PER_CHAT_BUCKETS: dict[str, _Bucket] = defaultdict(lambda: _Bucket(1, 1))
+
 STATE_FILE = get_base_dir() / "state.json"
 TOKEN_FILE = get_base_dir() / "token.json"
 GMAIL_OAUTH_SCOPES = ["https://mail.google.com/"]
 
 
+# Cached OAuth credentials so each connection doesn't re-read/parse token.json
+_CREDS = None
+
+
+def _save_token(creds):
+    """Persist refreshed credentials so the next process skips the refresh."""
+    tmp = TOKEN_FILE.with_suffix(".json.tmp")
+    try:
+        with open(tmp, "w") as f:
+            f.write(creds.to_json())
+        os.replace(tmp, TOKEN_FILE)
+    except OSError:
+        pass
+
+
 def get_imap_oauth_token():
-    """Load token.json, refresh if needed, return access token for IMAP XOAUTH2."""
+    """Load token.json (cached after first read), refresh if needed, return access token for IMAP XOAUTH2."""
+    global _CREDS
     from google.auth.transport.requests import Request
     from google.oauth2.credentials import Credentials
 
-    if not TOKEN_FILE.exists():
-        return None
-    creds = Credentials.from_authorized_user_file(str(TOKEN_FILE), GMAIL_OAUTH_SCOPES)
-    if not creds:
-        return None
-    if not creds.valid and creds.refresh_token:
-        creds.refresh(Request())
-    if not creds.valid:
+    if _CREDS is None:
+        if not TOKEN_FILE.exists():
+            return None
+        _CREDS = Credentials.from_authorized_user_file(str(TOKEN_FILE), GMAIL_OAUTH_SCOPES)
+        if not _CREDS:
+            return None
+    if not _CREDS.valid and _CREDS.refresh_token:
+        _CREDS.refresh(Request())
+        _save_token(_CREDS)
+    if not _CREDS.valid:
         return None
-    return creds.token
+    return _CREDS.token
+
+
+# Last-built SASL string, keyed by (email, token) — rebuilt only on refresh
+_SASL_CACHE: dict[tuple[str, str], bytes] = {}
 
 
 def imap_connect_with_oauth(client, email_address, access_token):
     """Authenticate IMAP connection using XOAUTH2."""
     # Raw SASL string; imaplib will base64-encode it before sending (do not pre-encode).
-    raw = ("user=" + email_address + "\x01auth=Bearer " + access_token + "\x01\x01").encode("utf-8")
+    key = (email_address, access_token)
+    raw = _SASL_CACHE.get(key)
+    if raw is None:
+        raw = ("user=" + email_address + "\x01auth=Bearer " + access_token + "\x01\x01").encode("utf-8")
+        _SASL_CACHE.clear()  # at most one live token per user
+        _SASL_CACHE[key] = raw
 
     def authobject(response):
         if response is not None and response.strip():
@@ -73,32 +158,100 @@ def imap_connect_with_oauth(client, email_address, access_token):
     client._imap.authenticate("XOAUTH2", authobject)
 
 
+def _make_client():
+    """Connect, authenticate (XOAUTH2 or password) and select the folder. One TLS handshake."""
+    import imapclient
+
+    use_oauth = TOKEN_FILE.exists() and not os.environ.get("IMAP_PASSWORD")
+    client = imapclient.IMAPClient(IMAP_HOST, port=IMAP_PORT, ssl=True, timeout=30)
+    try:
+        if use_oauth:
+            access_token = get_imap_oauth_token()
+            if not access_token:
+                raise RuntimeError("OAuth token missing or expired. Run 'python main.py auth' again.")
+            imap_connect_with_oauth(client, IMAP_USER, access_token)
+        else:
+            client.login(IMAP_USER, IMAP_PASSWORD)
+        client.select_folder(IMAP_FOLDER, readonly=False)
+    except Exception:
+        try:
+            client.shutdown()
+        except Exception:
+            pass
+        raise
+    return client
+
+
+def _close_client(client):
+    try:
+        client.logout()
+    except Exception:
+        try:
+            client.shutdown()
+        except Exception:
+            pass
+
+
+# Shared connections per (host, user) so the bot's on-demand lookups reuse the
+# session instead of reconnecting. Servers drop idle sessions around ~30 min,
+# so anything older than 25 min is reconnected rather than trusted.
+_CLIENT: dict[tuple[str, str], tuple] = {}
+_CLIENT_MAX_IDLE = 25 * 60
+
+
+def _get_shared_client():
+    """Return a connected, selected IMAPClient, reusing a cached one when still alive."""
+    import imapclient
+
+    key = (IMAP_HOST, IMAP_USER)
+    entry = _CLIENT.get(key)
+    if entry is not None:
+        client, last_used = entry
+        if time.monotonic() - last_used < _CLIENT_MAX_IDLE:
+            try:
+                client.noop()
+                _CLIENT[key] = (client, time.monotonic())
+                return client
+            except (imapclient.exceptions.IMAPClientError, OSError):
+                pass
+        _close_client(client)
+        del _CLIENT[key]
+    client = _make_client()
+    _CLIENT[key] = (client, time.monotonic())
+    return client
+
+
 def load_state():
     if STATE_FILE.exists():
         try:
-            with open(STATE_FILE) as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
+            with open(STATE_FILE, "rb") as f:
+                return _json_loads(f.read())
+        except (ValueError, IOError):
             pass
     return {"last_uid": 0}
 
 
 def save_state(state):
-    with open(STATE_FILE, "w") as f:
-        json.dump(state, f, indent=2)
-
-
-def decode_mime_header(header):
-    if header is None:
-        return ""
-    parts = decode_header(header)
-    result = []
-    for part, enc in parts:
-        if isinstance(part, bytes):
-            result.append(part.decode(enc or "utf-8", errors="replace"))
+    # Write-temp, fsync, then rename: atomic on POSIX and Windows, so a crash
+    # mid-write can never truncate state.json and reset the UID cursor.
+    tmp = STATE_FILE.with_suffix(".json.tmp")
+    with open(tmp, "wb") as f:
+        if _orjson is not None:
+            f.write(_orjson.dumps(state, option=_orjson.OPT_INDENT_2))
         else:
-            result.append(part or "")
-    return " ".join(result).strip()
+            f.write(json.dumps(state, indent=2).encode())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, STATE_FILE)
+
+
+def decode_header_bytes(raw: bytes, name: str) -> str:
+    """Decode one header from raw header bytes via the modern email policy.
+
+    policy.default parses RFC 2047 encoded words straight into str — no
+    decode_header list-of-tuples round and re-join per call.
+    """
+    return str(email.message_from_bytes(raw, policy=policy.default).get(name, "")).strip()
 
 
 # Match Claude magic-link URL anywhere in email (button link)
@@ -107,23 +260,126 @@ CLAUDE_MAGIC_LINK_RE = re.compile(
     re.IGNORECASE,
 )
 
+# Fallback HTML-stripping patterns, compiled once and applied to bytes so the
+# scan doesn't go through re's small shared pattern cache or decode UTF-8 first
+_TAG_RE = re.compile(rb"<[^>]+>")
+_WS_RE = re.compile(rb"\s+")
+
+# Optional: selectolax (C-based Modest engine) turns HTML into text in one
+# pass, with entity decoding and whitespace collapsing built in — no regex
+# tag stripping at all. Falls back to the hyperscan/regex path below.
+try:
+    from selectolax.parser import HTMLParser as _HTMLParser
+except ImportError:
+    _HTMLParser = None
+
+# Optional: Intel Hyperscan. One SIMD-accelerated DFA pass over the raw bytes
+# covers the magic-link, HTML-tag and whitespace patterns together, instead of
+# separate backtracking `re` scans per part. Falls back to `re` when absent.
+try:
+    import hyperscan as _hyperscan
+except ImportError:
+    _hyperscan = None
+
+_HS_LINK, _HS_TAG, _HS_WS = 0, 1, 2
+_HS_DB = None
+if _hyperscan is not None:
+    try:
+        _HS_DB = _hyperscan.Database(mode=_hyperscan.HS_MODE_BLOCK)
+        _HS_DB.compile(
+            expressions=[
+                rb"https://claude\.ai/magic-link#[^\s\"'<>)\]]+",
+                rb"<[^>]+>",
+                rb"\s+",
+            ],
+            ids=[_HS_LINK, _HS_TAG, _HS_WS],
+            flags=[_hyperscan.HS_FLAG_CASELESS | _hyperscan.HS_FLAG_SOM_LEFTMOST] * 3,
+        )
+    except Exception:
+        _HS_DB = None
+
+
+def _hs_find_link(data: bytes) -> bytes | None:
+    """Find the magic link via the hyperscan database (leftmost-longest match)."""
+    spans = []
+
+    def on_match(id_, start, end, flags, ctx=None):
+        if id_ == _HS_LINK:
+            spans.append((start, end))
+
+    _HS_DB.scan(data, match_event_handler=on_match)
+    if not spans:
+        return None
+    # Hyperscan reports one match per possible end offset; keep the longest
+    # run at the leftmost start.
+    start = min(s for s, _ in spans)
+    end = max(e for s, e in spans if s == start)
+    return data[start:end]
 
-def extract_claude_magic_link(msg) -> str | None:
-    """Extract the Claude.ai magic-link URL from email (any part)."""
-    def scan(payload: bytes | None) -> str | None:
-        if not payload:
-            return None
+
+def _hs_strip_html(raw: bytes) -> bytes:
+    """Collapse HTML tags and whitespace runs to single spaces in one scan."""
+    spans = []
+
+    def on_match(id_, start, end, flags, ctx=None):
+        if id_ in (_HS_TAG, _HS_WS):
+            spans.append((start, end))
+
+    _HS_DB.scan(raw, match_event_handler=on_match)
+    if not spans:
+        return raw
+    spans.sort()
+    merged = [list(spans[0])]
+    for s, e in spans[1:]:
+        if s <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], e)
+        else:
+            merged.append([s, e])
+    out = []
+    pos = 0
+    for s, e in merged:
+        out.append(raw[pos:s])
+        pos = e
+    out.append(raw[pos:])
+    return b" ".join(out)
+
+
+def _scan_link(payload: bytes | None) -> str | None:
+    """Find a magic-link URL in decoded payload bytes."""
+    if not payload:
+        return None
+    if _HS_DB is not None:
+        hit = _hs_find_link(payload)
+    else:
         m = CLAUDE_MAGIC_LINK_RE.search(payload)
-        if m:
-            url = m.group(0).decode("utf-8", errors="replace").rstrip("'\">)]")
-            return url if url.startswith("http") else None
+        hit = m.group(0) if m else None
+    if hit:
+        url = hit.decode("utf-8", errors="replace").rstrip("'\">)]")
+        return url if url.startswith("http") else None
+    return None
+
+
+def extract_claude_magic_link_raw(raw: bytes) -> str | None:
+    """Scan raw transport bytes for the magic link without parsing MIME.
+
+    Claude's email carries the link quoted-printable (not base64), so after
+    unfolding "="-soft line breaks one pass over the wire bytes finds it —
+    no per-part base64 decode, no Message allocation.
+    """
+    if not raw:
         return None
+    return _scan_link(bytes(raw).replace(b"=\r\n", b"").replace(b"=\n", b""))
+
 
+def extract_claude_magic_link(msg) -> str | None:
+    """Extract the Claude.ai magic-link URL from email (a parsed Message or raw bytes)."""
+    if isinstance(msg, (bytes, bytearray)):
+        return extract_claude_magic_link_raw(msg)
     if msg.is_multipart():
         for part in msg.walk():
             try:
                 payload = part.get_payload(decode=True)
-                u = scan(payload)
+                u = _scan_link(payload)
                 if u:
                     return u
             except Exception:
@@ -131,12 +387,111 @@ def extract_claude_magic_link(msg) -> str | None:
     else:
         try:
             payload = msg.get_payload(decode=True)
-            return scan(payload)
+            return _scan_link(payload)
         except Exception:
             pass
     return None
 
 
+def _plain_text_section(bodystructure, prefix=""):
+    """Return the section number ("1", "1.2", ...) of the first text/plain part, or None."""
+    try:
+        if not bodystructure.is_multipart:
+            # RFC 3501 media types are case-insensitive; Gmail returns TEXT/PLAIN
+            if bodystructure[0].lower() == b"text" and bodystructure[1].lower() == b"plain":
+                return prefix or "1"
+            return None
+        for i, part in enumerate(bodystructure[0], start=1):
+            section = f"{prefix}.{i}" if prefix else str(i)
+            found = _plain_text_section(part, section)
+            if found:
+                return found
+    except (AttributeError, IndexError, TypeError):
+        pass
+    return None
+
+
+def _today_imap_str() -> str:
+    """Today's date in IMAP SEARCH format, e.g. 27-Aug-2026."""
+    return date.today().strftime("%d-%b-%Y")
+
+
+def _fetch_claude_messages(client, uids):
+    """Batch-fetch subjects and text/plain bodies for Claude login emails.
+
+    One FETCH pulls ENVELOPE + BODYSTRUCTURE for every UID, then one batched
+    BODY.PEEK fetch per distinct text/plain section (in practice: one) pulls
+    the bodies — far fewer bytes and round-trips than full RFC822 per
+    message. All body fetches PEEK so reading doesn't clear the \\Unseen flag.
+
+    Returns {uid: (subject, body_bytes or None, section or None)} for the
+    messages whose subject passes the Claude check.
+    """
+    meta = client.fetch(uids, ["ENVELOPE", "BODYSTRUCTURE"])
+
+    subjects = {}
+    sections = {}
+    for uid in uids:
+        item = meta.get(uid)
+        if not item:
+            continue
+        # ENVELOPE carries the server-parsed subject as a short bytes field;
+        # reject non-Claude mail here before fetching any body bytes.
+        subj = getattr(item.get(b"ENVELOPE"), "subject", None) or b""
+        if b"=?" in subj:
+            # RFC 2047-encoded: decode first, filter on the decoded string
+            # (the server's SEARCH SUBJECT matched against the decoded form)
+            subject = decode_header_bytes(b"Subject: " + subj, "Subject")
+            low = subject.lower()
+            if "secure link" not in low or "claude" not in low:
+                continue
+        else:
+            s = subj.lower()
+            if b"secure link" not in s or b"claude" not in s:
+                continue
+            subject = subj.decode("utf-8", errors="replace").strip()
+        subjects[uid] = subject
+        bs = item.get(b"BODYSTRUCTURE")
+        sections[uid] = _plain_text_section(bs) if bs is not None else None
+
+    bodies = {}
+    by_section = {}
+    for uid, section in sections.items():
+        by_section.setdefault(section, []).append(uid)
+    for section, group in by_section.items():
+        spec = f"BODY.PEEK[{section}]" if section else "BODY.PEEK[]"
+        key = f"BODY[{section}]".encode() if section else b"BODY[]"
+        data = client.fetch(group, [spec])
+        for uid in group:
+            item = data.get(uid, {})
+            part = item.get(key)
+            if part is None:
+                part = next(
+                    (v for k, v in item.items() if isinstance(k, bytes) and k.startswith(b"BODY[")),
+                    None,
+                )
+            if part:
+                bodies[uid] = part
+
+    return {uid: (subjects[uid], bodies.get(uid), sections.get(uid)) for uid in subjects}
+
+
+def _extract_link_with_fallback(client, uid, body, section):
+    """Extract the link from the fetched part, re-fetching the full body only if needed."""
+    magic_link = extract_claude_magic_link(body or b"")
+    if magic_link:
+        return magic_link
+    if section is None and body:
+        raw = body  # already the full body
+    else:
+        raw = client.fetch([uid], ["BODY.PEEK[]"]).get(uid, {}).get(b"BODY[]")
+    if raw:
+        return extract_claude_magic_link_raw(raw) or extract_claude_magic_link(
+            email.message_from_bytes(raw)
+        )
+    return None
+
+
 def get_body(msg):
     """Extract plain text body from email message."""
     body = ""
@@ -159,11 +514,16 @@ def get_body(msg):
                     try:
                         payload = part.get_payload(decode=True)
                         if payload:
-                            raw = payload.decode(
-                                part.get_content_charset() or "utf-8", errors="replace"
-                            )
-                            body = re.sub(r"<[^>]+>", " ", raw)
-                            body = re.sub(r"\s+", " ", body).strip()
+                            charset = part.get_content_charset() or "utf-8"
+                            if _HTMLParser is not None:
+                                body = _HTMLParser(
+                                    payload.decode(charset, errors="replace")
+                                ).text(separator=" ", strip=True)
+                            elif _HS_DB is not None:
+                                body = _hs_strip_html(payload).decode(charset, errors="replace").strip()
+                            else:
+                                stripped = _WS_RE.sub(b" ", _TAG_RE.sub(b" ", payload))
+                                body = stripped.decode(charset, errors="replace").strip()
                             break
                     except Exception:
                         pass
@@ -187,11 +547,29 @@ def send_telegram(text: str, chat_id: str | None = None) -> tuple[bool, str | No
         chunk = text[i : i + TELEGRAM_MAX_LENGTH]
         payload = {"chat_id": cid, "text": chunk, "parse_mode": "HTML"}
         try:
-            r = requests.post(url, json=payload, timeout=30)
-            if r.status_code != 200:
-                r = requests.post(url, data={"chat_id": cid, "text": chunk}, timeout=30)
+            for attempt in range(5):
+                _GLOBAL_BUCKET.acquire()
+                _PER_CHAT_BUCKETS[cid].acquire()
+                r = _SESSION.post(url, json=payload, timeout=30)
+                if r.status_code not in (200, 429):
+                    # The plain-text retry is a send too: take tokens for it
+                    _GLOBAL_BUCKET.acquire()
+                    _PER_CHAT_BUCKETS[cid].acquire()
+                    r = _SESSION.post(url, data={"chat_id": cid, "text": chunk}, timeout=30)
+                if r.status_code != 429:
+                    break
+                # Honor the server's retry_after, with exponential fallback + jitter
+                try:
+                    data = _json_loads(r.content) if r.content else {}
+                except ValueError:  # non-JSON error body (e.g. 502 HTML page)
+                    data = {}
+                retry_after = data.get("parameters", {}).get("retry_after", 2 ** attempt)
+                time.sleep(retry_after + random.uniform(0, 0.5))
             if r.status_code != 200:
-                data = r.json() if r.text else {}
+                try:
+                    data = _json_loads(r.content) if r.content else {}
+                except ValueError:
+                    data = {}
                 desc = data.get("description", r.text or str(r.status_code))
                 if r.status_code == 403 and "can't initiate conversation" in desc.lower():
                     return False, "Telegram 403: The recipient must message the bot first (e.g. send 'hi' to the bot), then run again."
@@ -213,38 +591,33 @@ def get_latest_claude_link_from_gmail() -> tuple[str | None, str | None]:
     if not use_oauth and not IMAP_PASSWORD:
         return None, "Run 'python main.py auth' or set IMAP_PASSWORD"
 
-    with imapclient.IMAPClient(IMAP_HOST, port=IMAP_PORT, ssl=True, timeout=30) as client:
-        if use_oauth:
-            access_token = get_imap_oauth_token()
-            if not access_token:
-                return None, "OAuth expired. Run 'python main.py auth' again."
-            imap_connect_with_oauth(client, IMAP_USER, access_token)
-        else:
-            client.login(IMAP_USER, IMAP_PASSWORD)
-        client.select_folder(IMAP_FOLDER, readonly=True)
-        t = date.today()
-        today_str = f"{t.day:02d}-{('Jan','Feb','Mar','Apr','May','Jun','Jul','Aug','Sep','Oct','Nov','Dec')[t.month-1]}-{t.year}"
-        try:
-            uids = client.search(["SUBJECT", "Secure link", "ON", today_str])
-        except Exception as e:
-            return None, f"IMAP search failed: {e}"
-        if not uids:
-            return None, "No Claude login email from today."
-        uid = max(uids)
-        try:
-            data = client.fetch([uid], ["RFC822"])
-            if uid not in data:
-                return None, "Fetch failed"
-            msg = email.message_from_bytes(data[uid][b"RFC822"])
-        except Exception as e:
-            return None, f"Fetch failed: {e}"
-        subject = decode_mime_header(msg.get("Subject"))
-        if "secure link" not in subject.lower() or "claude" not in subject.lower():
-            return None, "No Claude login email from today."
-        link = extract_claude_magic_link(msg)
-        if not link:
-            return None, "No magic-link URL in today's Claude email."
-        return link, None
+    try:
+        client = _get_shared_client()
+    except RuntimeError as e:
+        return None, str(e)
+    except Exception as e:
+        return None, f"IMAP connect failed: {e}"
+    try:
+        uids = client.search(["SUBJECT", "Secure link", "ON", _today_imap_str()])
+    except Exception as e:
+        return None, f"IMAP search failed: {e}"
+    if not uids:
+        return None, "No Claude login email from today."
+    uid = max(uids)
+    try:
+        msgs = _fetch_claude_messages(client, [uid])
+    except Exception as e:
+        return None, f"Fetch failed: {e}"
+    if uid not in msgs:
+        return None, "No Claude login email from today."
+    _subject, body, section = msgs[uid]
+    try:
+        link = _extract_link_with_fallback(client, uid, body, section)
+    except Exception as e:
+        return None, f"Fetch failed: {e}"
+    if not link:
+        return None, "No magic-link URL in today's Claude email."
+    return link, None
 
 
 def escape_html(s: str) -> str:
@@ -255,90 +628,134 @@ def escape_html(s: str) -> str:
     )
 
 
-def run(dry_run=False):
-    def out(msg, err=False):
-        f = sys.stderr if err else sys.stdout
-        print(msg, file=f, flush=True)
-
-    out("Starting...")
+def _check_config():
+    """Validate env config, exiting with a helpful message if incomplete."""
     if not IMAP_USER:
-        out("Set IMAP_USER (e.g. your_email@gmail.com).", err=True)
+        log.error("Set IMAP_USER (e.g. your_email@gmail.com).")
         sys.exit(1)
     use_oauth = TOKEN_FILE.exists() and not os.environ.get("IMAP_PASSWORD")
     if not use_oauth and not IMAP_PASSWORD:
-        out("Use either: (1) Gmail OAuth: run 'python main.py auth' once, or (2) set IMAP_PASSWORD.", err=True)
+        log.error("Use either: (1) Gmail OAuth: run 'python main.py auth' once, or (2) set IMAP_PASSWORD.")
         sys.exit(1)
     if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
-        out("Set TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID in .env", err=True)
+        log.error("Set TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID in .env")
         sys.exit(1)
-    out("Connecting to Gmail...")
-    state = load_state()
 
-    # 30s timeout so we don't hang forever on auth/read
-    with imapclient.IMAPClient(IMAP_HOST, port=IMAP_PORT, ssl=True, timeout=30) as client:
-        if use_oauth:
-            access_token = get_imap_oauth_token()
-            if not access_token:
-                out("OAuth token missing or expired. Run 'python main.py auth' again.", err=True)
-                sys.exit(1)
-            out("OAuth OK, authenticating with Gmail IMAP (XOAUTH2)...")
-            imap_connect_with_oauth(client, IMAP_USER, access_token)
-            out("Authenticated.")
+
+def _poll_once(client, state, dry_run=False):
+    """Search for new Claude login emails on an already-connected client and forward them."""
+    import imapclient
+
+    last_uid = int(state.get("last_uid", 0))
+    try:
+        if last_uid:
+            # Only messages newer than what we already forwarded; the server
+            # skips everything up to last_uid instead of scanning today's mail.
+            uids = client.search(["UID", f"{last_uid + 1}:*", "SUBJECT", "Secure link"])
         else:
-            client.login(IMAP_USER, IMAP_PASSWORD)
-        out("Selecting INBOX...")
-        client.select_folder(IMAP_FOLDER, readonly=False)
+            # First run (no UID cursor yet): fall back to today's unread mail
+            uids = client.search(["UNSEEN", "SUBJECT", "Secure link", "ON", _today_imap_str()])
+    except imapclient.exceptions.IMAPClientError:
+        raise
+    except Exception as e:
+        log.error(f"IMAP search failed: {e}")
+        return
+    # "n:*" always matches the newest message even when its UID <= n; drop it
+    uids = sorted(u for u in uids if u > last_uid) if uids else []
+    log.info(f"[1] Found {len(uids)} new Claude login email(s).")
+    if not uids:
+        if not last_uid:
+            log.info("No unread Claude login emails. Mark the 'Secure link to log in to Claude.ai' email as unread and run again.")
+        return
+
+    try:
+        msgs = _fetch_claude_messages(client, uids)
+    except imapclient.exceptions.IMAPClientError:
+        raise
+    except Exception as e:
+        log.error(f"[2] Fetch failed: {e}")
+        return
+
+    for uid in sorted(msgs):
+        subject, body, section = msgs[uid]
+        log.info(f"[3] Claude login email: {subject[:60]}...")
 
-        # Only Anthropic login emails from today: subject "Secure link..." and ON today
-        t = date.today()
-        today_str = f"{t.day:02d}-{('Jan','Feb','Mar','Apr','May','Jun','Jul','Aug','Sep','Oct','Nov','Dec')[t.month-1]}-{t.year}"
         try:
-            uids = client.search(["UNSEEN", "SUBJECT", "Secure link", "ON", today_str])
+            magic_link = _extract_link_with_fallback(client, uid, body, section)
+        except imapclient.exceptions.IMAPClientError:
+            raise
         except Exception as e:
-            out(f"IMAP search failed: {e}", err=True)
-            return
-        uids = sorted(uids) if uids else []
-        out(f"[1] Found {len(uids)} unread Claude login email(s) from today ({today_str}).")
-        if not uids:
-            out("No unread Claude login emails. Mark the 'Secure link to log in to Claude.ai' email as unread and run again.")
-            return
-
-        for uid in uids:
-            try:
-                data = client.fetch([uid], ["RFC822", "INTERNALDATE"])
-                if uid not in data:
-                    out(f"[2] Fetch failed for uid {uid}.", err=True)
-                    continue
-                msg = email.message_from_bytes(data[uid][b"RFC822"])
-            except Exception as e:
-                out(f"[2] Fetch uid {uid}: {e}", err=True)
-                continue
+            log.error(f"[2] Fetch uid {uid}: {e}")
+            continue
+        if not magic_link:
+            log.error("[4] No magic-link URL found in this email.")
+            continue
+        log.info(f"[4] Extracted link: {magic_link[:60]}...")
+
+        if dry_run:
+            log.info("(dry-run) Would send to Telegram: " + magic_link)
+            continue
+
+        log.info("[5] Sending to Telegram...")
+        ok, err_msg = send_telegram(magic_link)
+        if ok:
+            client.set_flags([uid], [b"\\Seen"])
+            state["last_uid"] = max(uid, int(state.get("last_uid", 0)))
+            save_state(state)
+            log.info("[5] Sent to Telegram.")
+        else:
+            if err_msg:
+                log.error(err_msg)
+            else:
+                log.error("[5] Telegram send failed.")
 
-            subject = decode_mime_header(msg.get("Subject"))
-            if "secure link" not in subject.lower() or "claude" not in subject.lower():
-                continue
-            out(f"[3] Claude login email: {subject[:60]}...")
 
-            magic_link = extract_claude_magic_link(msg)
-            if not magic_link:
-                out("[4] No magic-link URL found in this email.", err=True)
-                continue
-            out(f"[4] Extracted link: {magic_link[:60]}...")
+def run(dry_run=False):
+    log.info("Starting...")
+    _check_config()
+    log.info("Connecting to Gmail...")
+    state = load_state()
+    client = _make_client()
+    try:
+        _poll_once(client, state, dry_run=dry_run)
+    finally:
+        _close_client(client)
 
-            if dry_run:
-                out("(dry-run) Would send to Telegram: " + magic_link)
-                continue
 
-            out("[5] Sending to Telegram...")
-            ok, err_msg = send_telegram(magic_link)
-            if ok:
-                client.set_flags([uid], [b"\\Seen"])
-                out("[5] Sent to Telegram.")
+def run_loop(interval):
+    """Forward new emails as they arrive, over one persistent IMAP session.
+
+    Uses IMAP IDLE (RFC 2177) so the server pushes EXISTS the moment mail
+    lands — no per-cycle SEARCH, near-zero latency. IDLE is restarted every
+    25 minutes (Gmail drops IDLE sessions around 29). If the server lacks
+    IDLE we fall back to polling every `interval` seconds with NOOP
+    keep-alives. Reconnects lazily when the server drops us.
+    """
+    import imapclient
+
+    _check_config()
+    log.info("Connecting to Gmail...")
+    state = load_state()
+    client = _make_client()
+    while True:
+        try:
+            _poll_once(client, state)
+            if client.has_capability("IDLE"):
+                client.idle()
+                try:
+                    client.idle_check(timeout=_CLIENT_MAX_IDLE)
+                finally:
+                    client.idle_done()
             else:
-                if err_msg:
-                    out(err_msg, err=True)
-                else:
-                    out("[5] Telegram send failed.", err=True)
+                time.sleep(interval)
+                client.noop()
+        except (imapclient.exceptions.IMAPClientError, OSError) as e:
+            log.error(f"IMAP connection lost ({e}), reconnecting...")
+            _close_client(client)
+            client = _make_client()
+        except Exception as e:
+            log.error(f"Error: {e}")
+            time.sleep(interval)
 
 
 if __name__ == "__main__":
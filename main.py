@@ -65,18 +65,18 @@ def main():
         return 0
 
     if args.command == "run":
-        from forward import run as forward_run
+        from forward import run_loop
         interval = max(60, args.interval)
-        print(f"Running forwarder every {interval}s. Ctrl+C to stop.")
+        print("Running forwarder (IMAP IDLE, pushes new mail instantly). Ctrl+C to stop.")
         while True:
             try:
-                forward_run()
+                run_loop(interval)
             except KeyboardInterrupt:
                 print("\nStopped.")
                 return 0
             except Exception as e:
                 print(f"Error: {e}", file=sys.stderr)
-            time.sleep(interval)
+                time.sleep(interval)
 
 
 if __name__ == "__main__":
@@ -7,23 +7,32 @@ No interval — runs when they ask. Run with: python main.py bot
 from env_loader import load_dotenv
 load_dotenv()
 
+import asyncio
+import logging
 import sys
-import requests
+import threading
+import time
+from collections import deque
 
-# Import after .env is loaded
+# Import after .env is loaded; _SESSION is the shared keep-alive connection
+# to api.telegram.org so the long-poll and replies skip per-call TLS setup.
 from forward import (
     TELEGRAM_BOT_TOKEN,
     TELEGRAM_CHAT_ID,
+    _SESSION,
+    _json_loads,
     get_latest_claude_link_from_gmail,
     send_telegram,
 )
 
 BASE = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
 
+log = logging.getLogger("e2t")
+
 
 def set_bot_commands():
     """Register /link so it shows in the bot menu."""
-    r = requests.post(
+    r = _SESSION.post(
         BASE + "/setMyCommands",
         json={
             "commands": [
@@ -34,18 +43,18 @@ def set_bot_commands():
         timeout=10,
     )
     if r.status_code != 200:
-        print(f"Warning: setMyCommands failed: {r.status_code} {r.text}", file=sys.stderr)
+        log.warning(f"setMyCommands failed: {r.status_code} {r.text}")
 
 
 def set_menu_button():
     """Show the menu button (with commands) in the chat."""
-    r = requests.post(
+    r = _SESSION.post(
         BASE + "/setChatMenuButton",
         json={"menu_button": {"type": "commands"}},
         timeout=10,
     )
     if r.status_code != 200:
-        print(f"Warning: setChatMenuButton failed: {r.status_code} {r.text}", file=sys.stderr)
+        log.warning(f"setChatMenuButton failed: {r.status_code} {r.text}")
 
 
 def reply(chat_id: int | str, text: str):
@@ -53,27 +62,65 @@ def reply(chat_id: int | str, text: str):
     send_telegram(text, chat_id=str(chat_id))
 
 
+# The shared IMAP connection isn't thread-safe; serialize lookups across
+# concurrently dispatched updates (replies still overlap freely).
+_IMAP_LOCK = threading.Lock()
+
+# Duplicate /link requests within this window (retries, multiple devices)
+# reuse the previous result instead of redoing the whole IMAP cycle.
+_LINK_TTL = 30
+_LINK_CACHE: tuple[float, str | None, str | None] = (0.0, None, None)
+
+# Telegram redelivers updates if an earlier poll wasn't acked; skip repeats
+_SEEN_UPDATES: deque = deque(maxlen=512)
+
+# Accepted commands, hashed once at import instead of a tuple scan per update
+_COMMANDS = frozenset({"/link", "link", "/getlink", "get link", "/start", "start"})
+_START = frozenset({"/start", "start"})
+
+
+def _get_link_cached() -> tuple[str | None, str | None]:
+    """get_latest_claude_link_from_gmail with a short-TTL cache (successes only)."""
+    global _LINK_CACHE
+    with _IMAP_LOCK:
+        ts, link, err = _LINK_CACHE
+        if time.monotonic() - ts < _LINK_TTL:
+            return link, err
+        link, err = get_latest_claude_link_from_gmail()
+        # Errors are not cached, so the next request retries immediately
+        _LINK_CACHE = (time.monotonic() if link else 0.0, link, err)
+        return link, err
+
+
 def handle_update(update: dict) -> bool:
     """Process one update. Return True if we consumed it."""
+    update_id = update.get("update_id")
+    if update_id is not None:
+        if update_id in _SEEN_UPDATES:
+            return False
+        _SEEN_UPDATES.append(update_id)
     msg = update.get("message") or update.get("edited_message")
     if not msg:
         return False
     chat_id = msg.get("chat", {}).get("id")
-    text = (msg.get("text") or "").strip().lower()
-    if not text:
+    raw = msg.get("text")
+    if not raw:
         return False
     # Only respond to the configured user (recipient)
     if str(chat_id) != str(TELEGRAM_CHAT_ID):
         return False
-    if text not in ("/link", "link", "/getlink", "get link", "/start", "start"):
+    # Commands are short; slice before normalizing so a multi-KB paste isn't
+    # stripped/lowercased just to be rejected
+    text = raw[:16].strip().lower()
+    if text not in _COMMANDS:
         return False
 
-    if text in ("/start", "start"):
+    if text in _START:
         reply(chat_id, "Hi! Use /link to get the latest Claude sign-in link from today's email.")
         return True
 
     reply(chat_id, "Checking your email…")
-    link, err = get_latest_claude_link_from_gmail()
+    link, err = _get_link_cached()
     if link:
         reply(chat_id, link)
     else:
@@ -81,35 +128,59 @@ def handle_update(update: dict) -> bool:
     return True
 
 
-def run_bot():
-    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
-        print("Set TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID in .env", file=sys.stderr)
-        sys.exit(1)
-    set_bot_commands()
-    set_menu_button()
-    print("Bot running. The recipient can open the bot and tap Menu → Get Claude sign-in link (or send /link). Ctrl+C to stop.")
+async def handle_update_async(update: dict, sem: asyncio.Semaphore):
+    """Run one (blocking) handle_update in the thread pool, bounded by sem."""
+    async with sem:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, handle_update, update)
+
+
+async def _run_bot_async():
+    loop = asyncio.get_running_loop()
     offset = None
+    # Keep at most 4 updates in flight — stays well under Telegram rates
+    sem = asyncio.Semaphore(4)
+    pending = set()
     while True:
         try:
-            r = requests.get(
-                BASE + "/getUpdates",
-                params={"timeout": 60, "offset": offset},
-                timeout=70,
+            # Short long-poll: asyncio.run joins executor threads on shutdown,
+            # so Ctrl+C would otherwise wait out the full poll before exiting
+            r = await loop.run_in_executor(
+                None,
+                lambda: _SESSION.get(
+                    BASE + "/getUpdates",
+                    params={"timeout": 10, "offset": offset},
+                    timeout=20,
+                ),
             )
             if r.status_code != 200:
-                print(f"getUpdates error: {r.status_code}", file=sys.stderr)
+                log.error(f"getUpdates error: {r.status_code}")
                 continue
-            data = r.json()
+            data = _json_loads(r.content)
             if not data.get("ok"):
                 continue
             for u in data.get("result", []):
                 offset = u["update_id"] + 1
-                handle_update(u)
-        except KeyboardInterrupt:
-            print("\nStopped.")
-            break
+                # Dispatch and go straight back to long-polling, so a slow
+                # IMAP lookup doesn't make the next command wait
+                task = asyncio.create_task(handle_update_async(u, sem))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
         except Exception as e:
-            print(f"Error: {e}", file=sys.stderr)
+            log.error(f"Error: {e}")
+
+
+def run_bot():
+    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
+        print("Set TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID in .env", file=sys.stderr)
+        sys.exit(1)
+    set_bot_commands()
+    set_menu_button()
+    print("Bot running. The recipient can open the bot and tap Menu → Get Claude sign-in link (or send /link). Ctrl+C to stop.")
+    try:
+        asyncio.run(_run_bot_async())
+    except KeyboardInterrupt:
+        print("\nStopped.")
 
 
 if __name__ == "__main__":
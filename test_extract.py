@@ -2,6 +2,7 @@
 """Fetch latest Claude email from inbox and print extracted magic-link URL."""
 import email
 import sys
+from email import policy
 
 from env_loader import load_dotenv
 load_dotenv()
@@ -13,8 +14,8 @@ from forward import (
     IMAP_USER,
     SUBJECT_FILTER,
     TOKEN_FILE,
-    decode_mime_header,
     extract_claude_magic_link,
+    extract_claude_magic_link_raw,
     get_imap_oauth_token,
     imap_connect_with_oauth,
 )
@@ -49,15 +50,19 @@ def main():
             print("Fetch failed for uid", uid, file=sys.stderr)
             return 1
 
-        msg = email.message_from_bytes(data[uid][b"RFC822"])
-        subject = decode_mime_header(msg.get("Subject"))
-        from_addr = decode_mime_header(msg.get("From"))
+        raw = data[uid][b"RFC822"]
+        msg = email.message_from_bytes(raw)
+        # policy.default parses headers as already-decoded strings
+        hdrs = email.message_from_bytes(raw, policy=policy.default)
+        subject = str(hdrs.get("Subject", ""))
+        from_addr = str(hdrs.get("From", ""))
 
         print("Subject:", subject)
         print("From:", from_addr)
         print()
 
-        magic_link = extract_claude_magic_link(msg)
+        # Fast path: scan the wire bytes directly; MIME walk only as fallback
+        magic_link = extract_claude_magic_link_raw(raw) or extract_claude_magic_link(msg)
         if magic_link:
             print("Extracted magic-link URL:")
             print(magic_link)